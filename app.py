@@ -3,7 +3,11 @@ import streamlit as st
 st.set_page_config(page_title="Wedding App", page_icon="💍", layout="centered")
 
 import pandas as pd
-from c_wedding_app import WeddingApp, I18N
+from c_wedding_app import WeddingApp, I18N, GIFT_CODE_MAX_PICKS, GIFT_AMOUNT_MAX
+from c_profiler import PROFILER
+
+# --- Profiling opt-in (solo operatore: WEDDING_PROFILE=1 oppure ?profile=<WEDDING_PROFILE_TOKEN>) ---
+_capture = PROFILER.start("app") if PROFILER.is_requested(st.query_params) else None
 
 # --- Video Google Drive ---
 VIDEO_ID = "1qf1j6VvQkn8FApyN2V6yB8lEqs709ZkC"
@@ -241,8 +245,8 @@ elif st.session_state.step == 3:
         for name in st.session_state.cart:
             st.session_state.amounts.setdefault(name, 0.0)
             st.number_input(
-                name, min_value=0.0, step=5.0,
-                value=float(st.session_state.amounts[name]),
+                name, min_value=0.0, max_value=GIFT_AMOUNT_MAX, step=5.0,
+                value=min(float(st.session_state.amounts[name]), GIFT_AMOUNT_MAX),
                 key=f"amt_{name}"
             )
             st.session_state.amounts[name] = st.session_state[f"amt_{name}"]
@@ -257,11 +261,29 @@ elif st.session_state.step == 3:
         with col2:
             if st.button(T["generate_code"], type="primary"):
                 selections = [(n, st.session_state.amounts[n]) for n in st.session_state.cart if st.session_state.amounts[n] > 0]
-                code = app.generate_gift_code(selections, st.session_state.lang)
-                st.session_state.gift_code = code
-                guest_id = str(hash(str(selections)))[:10]
-                app.save_donation(guest_id, st.session_state.lang, selections, code)
-                goto(4)
+                # il codice deve stare nella causale del bonifico
+                if len(selections) > GIFT_CODE_MAX_PICKS:
+                    st.error(
+                        f"Carrello troppo grande per la causale del bonifico (max {GIFT_CODE_MAX_PICKS} aziende)."
+                        if st.session_state.lang == "it"
+                        else f"Basket too large for the bank transfer note (max {GIFT_CODE_MAX_PICKS} companies)."
+                    )
+                    code = None
+                else:
+                    try:
+                        code = app.generate_gift_code(selections, st.session_state.lang)
+                    except ValueError as e:
+                        st.error(
+                            f"Impossibile generare il codice: {e}"
+                            if st.session_state.lang == "it"
+                            else f"Could not generate the code: {e}"
+                        )
+                        code = None
+                if code:
+                    st.session_state.gift_code = code
+                    guest_id = str(hash(str(selections)))[:10]
+                    app.save_donation(guest_id, st.session_state.lang, selections, code)
+                    goto(4)
 
 # ---------- Step 4 Gift code + Stats ----------
 elif st.session_state.step == 4:
@@ -274,3 +296,6 @@ elif st.session_state.step == 4:
     if not top.empty:
         st.bar_chart(top.set_index("brand"))
     st.button(T["reset"], on_click=lambda: st.session_state.clear())
+
+# ---------- Profiling: chiude la cattura del rerun ----------
+PROFILER.finish_rerun(_capture, st.session_state.get("step"), st.session_state, app.data_sizes())
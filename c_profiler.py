@@ -0,0 +1,258 @@
+# c_profiler.py
+from __future__ import annotations
+
+import os
+import sys
+import time
+import json
+import hmac
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from typing import Dict, Optional, Any, Mapping, Callable
+
+# -------------------------
+# Opt-in per-rerun profiling (operator only)
+# -------------------------
+# Attivazione:
+#   WEDDING_PROFILE=1                      -> profila ogni rerun (rate-limited)
+#   WEDDING_PROFILE_TOKEN=<segreto> + ?profile=<segreto> nell'URL -> solo quella sessione
+# Output in WEDDING_PROFILE_DIR (default ./profiles):
+#   <nome>.pstats  -> python -m pstats / snakeviz
+#   <nome>.folded  -> collapsed stacks (flamegraph.pl, speedscope)
+#   <nome>.json    -> tag della cattura (step, sessione, dimensioni dati)
+# Su Python >= 3.12 cProfile usa sys.monitoring (globale al processo): il .pstats include
+# anche i rerun concorrenti delle altre sessioni (tag "pstats_scope": "process").
+# Il .folded campiona solo il thread dello script.
+
+ENV_ENABLE = "WEDDING_PROFILE"
+ENV_TOKEN = "WEDDING_PROFILE_TOKEN"
+ENV_DIR = "WEDDING_PROFILE_DIR"
+ENV_MIN_INTERVAL = "WEDDING_PROFILE_MIN_INTERVAL"
+ENV_MAX_FILES = "WEDDING_PROFILE_MAX_CAPTURES"
+QUERY_PARAM = "profile"
+# < 3.12: disable() agisce solo sul thread chiamante, quindi lo spegne sempre il thread dello script
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+
+
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _session_id() -> Optional[str]:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+class ProfileCapture:
+    """One running capture: cProfile on the script thread + a stack sampler."""
+
+    def __init__(self, page: str, thread_id: int, sample_interval: float, max_seconds: float,
+                 on_expire: Optional[Callable[["ProfileCapture"], None]] = None):
+        self.page = page
+        self.thread_id = thread_id
+        self.started_at = time.time()
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._sample_interval = sample_interval
+        self._deadline = time.monotonic() + max_seconds
+        self._on_expire = on_expire
+        self._profile = cProfile.Profile()
+        self._sampler = threading.Thread(target=self._sample, name="wedding-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._sampler.start()
+        self._profile.enable()
+
+    def stop(self) -> cProfile.Profile:
+        self._profile.disable()
+        self._stop.set()
+        if self._sampler.is_alive() and self._sampler is not threading.current_thread():
+            self._sampler.join(timeout=1.0)
+        return self._profile
+
+    def _sample(self) -> None:
+        while not self._stop.is_set() and time.monotonic() < self._deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            del frame
+            self._stop.wait(self._sample_interval)
+        # watchdog: scadenza o thread dello script terminato senza finish()
+        if not self._stop.is_set() and self._on_expire is not None:
+            self._on_expire(self)
+
+    def owner_alive(self) -> bool:
+        return self.thread_id in sys._current_frames()
+
+
+class RerunProfiler:
+    """Rate-limited profiler shared by all sessions of the Streamlit server.
+
+    Only one capture runs at a time, a new one starts at most every
+    ``min_interval`` seconds, and at most ``max_captures`` are kept on disk.
+    """
+
+    def __init__(self, out_dir: str = "profiles", min_interval: float = 30.0, max_captures: int = 50,
+                 sample_interval: float = 0.005, max_seconds: float = 60.0,
+                 always_on: bool = False, token: str = ""):
+        self.out_dir = out_dir
+        self.min_interval = min_interval
+        self.max_captures = max_captures
+        self.sample_interval = sample_interval
+        self.max_seconds = max_seconds
+        self.always_on = always_on
+        self.token = token
+        self._lock = threading.Lock()
+        self._active: Optional[ProfileCapture] = None
+        self._last_start = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RerunProfiler":
+        return cls(
+            out_dir=os.environ.get(ENV_DIR, "profiles"),
+            min_interval=_float_env(ENV_MIN_INTERVAL, 30.0),
+            max_captures=int(_float_env(ENV_MAX_FILES, 50)),
+            always_on=os.environ.get(ENV_ENABLE, "") == "1",
+            token=os.environ.get(ENV_TOKEN, ""),
+        )
+
+    # ---------- Activation ----------
+    def is_requested(self, query_params: Optional[Mapping[str, Any]] = None) -> bool:
+        if self.always_on:
+            return True
+        if not self.token or not query_params:
+            return False
+        try:
+            given = query_params.get(QUERY_PARAM)
+            if isinstance(given, list):
+                given = given[0] if given else None
+            return bool(given) and hmac.compare_digest(str(given).encode(), self.token.encode())
+        except Exception:
+            return False
+
+    # ---------- Capture lifecycle ----------
+    def start(self, page: str) -> Optional[ProfileCapture]:
+        thread_id = threading.get_ident()
+        stale = None
+        with self._lock:
+            active = self._active
+            if active is not None:
+                # rerun interrotto (RerunException/st.stop) sullo stesso thread, o thread morto
+                if active.thread_id == thread_id or not active.owner_alive():
+                    stale = active
+                    self._active = None
+                else:
+                    return None
+            now = time.monotonic()
+            capture = None
+            if now - self._last_start >= self.min_interval:
+                capture = ProfileCapture(page, thread_id, self.sample_interval, self.max_seconds, self._expire)
+                self._active = capture
+                self._last_start = now
+        if stale is not None:
+            self._write(stale, stale.stop(), {"interrupted": True})
+        if capture is None:
+            return None
+        try:
+            capture.start()
+        except ValueError:
+            # un altro profiler (es. debugger) è già attivo nel processo
+            capture.stop()
+            with self._lock:
+                self._active = None
+            return None
+        return capture
+
+    def finish(self, capture: Optional[ProfileCapture], tags: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        if capture is None:
+            return None
+        # spegne sempre il profiler del thread chiamante, anche se il watchdog ha già scritto la cattura
+        profile = capture.stop()
+        with self._lock:
+            if self._active is not capture:
+                return None
+            self._active = None
+        return self._write(capture, profile, tags or {})
+
+    def finish_rerun(self, capture: Optional[ProfileCapture], step: Any, session_state: Mapping[str, Any],
+                     sizes: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        if capture is None:
+            return None
+        return self.finish(capture, {
+            "step": step,
+            "session_id": _session_id(),
+            "lang": session_state.get("lang"),
+            "selected_tags": len(session_state.get("selected_tags", ())),
+            "cart_items": len(session_state.get("cart", ())),
+            **(sizes or {}),
+        })
+
+    def _expire(self, capture: ProfileCapture) -> None:
+        # Gira sul thread del sampler. Su 3.12 disable() è globale e si può chiudere qui;
+        # prima di 3.12 il profiler resta installato sul thread dello script finché è vivo,
+        # quindi lo slot resta occupato e lo chiude finish()/start() su quel thread.
+        if not PROCESS_WIDE_PROFILER and capture.owner_alive():
+            return
+        with self._lock:
+            if self._active is not capture:
+                return
+            self._active = None
+        self._write(capture, capture.stop(), {"interrupted": True})
+
+    # ---------- Output ----------
+    def _write(self, capture: ProfileCapture, profile: cProfile.Profile, tags: Dict[str, Any]) -> Optional[str]:
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(capture.started_at))
+            step = tags.get("step", "na")
+            session = str(tags.get("session_id") or "anon")[:8]
+            base = os.path.join(self.out_dir, f"{stamp}_{capture.page}_step{step}_{session}")
+
+            pstats.Stats(profile).dump_stats(base + ".pstats")
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                for stack, count in capture.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            meta = {
+                "page": capture.page,
+                "started_at": capture.started_at,
+                "duration_s": round(time.time() - capture.started_at, 4),
+                "samples": sum(capture.stacks.values()),
+                "sample_interval_s": self.sample_interval,
+                "pstats_scope": "process" if PROCESS_WIDE_PROFILER else "thread",
+                "folded_scope": "thread",
+                **tags,
+            }
+            with open(base + ".json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2, default=str)
+            self._prune()
+            return base
+        except Exception:
+            return None
+
+    def _prune(self) -> None:
+        bases = sorted({os.path.splitext(n)[0] for n in os.listdir(self.out_dir)
+                        if n.endswith((".pstats", ".folded", ".json"))})
+        for old in bases[:max(0, len(bases) - self.max_captures)]:
+            for ext in (".pstats", ".folded", ".json"):
+                path = os.path.join(self.out_dir, old + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# Istanza unica per processo: il modulo resta in sys.modules tra i rerun di Streamlit
+PROFILER = RerunProfiler.from_env()
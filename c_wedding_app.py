@@ -4,10 +4,11 @@ from __future__ import annotations
 import os
 import re
 import time
-import json
 import csv
+import base64
+import binascii
 import random
-import hashlib
+import threading
 from typing import List, Dict, Tuple, Optional, Set
 
 import pandas as pd
@@ -86,6 +87,49 @@ Our idea is to let you transform your gift into a **symbolic** basket of famous
 }
 
 
+# -------------------------
+# Gift code helpers (varint LEB128)
+# -------------------------
+GIFT_CODE_VERSION = 1
+# limite per la causale del bonifico (SEPA: 140 caratteri, lasciamo spazio al nome dell'ospite)
+GIFT_CODE_MAX_PICKS = 10
+GIFT_CODE_MAX_LEN = 100
+# tetto per azienda: < 2^21 centesimi -> varint di 3 byte, così 10 scelte stanno sempre in GIFT_CODE_MAX_LEN
+GIFT_AMOUNT_MAX = 20000.0
+
+# payload base32 già emessi per ledger (chiave: percorso di donations.csv), condivisi fra sessioni Streamlit
+_ISSUED_PAYLOADS: Dict[str, Set[str]] = {}
+# primo suffisso da provare per ogni carrello: generazione in blocco senza rifare tutti i tentativi
+_NEXT_SUFFIX: Dict[str, Dict[bytes, int]] = {}
+_ISSUED_LOCK = threading.RLock()
+
+
+def _varint_put(buf: bytearray, value: int) -> None:
+    if value < 0:
+        raise ValueError(f"varint must be non-negative: {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            buf.append(byte | 0x80)
+        else:
+            buf.append(byte)
+            return
+
+
+def _varint_get(buf: bytes, pos: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        if pos >= len(buf):
+            raise ValueError("Truncated gift code")
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
 # -------------------------
 # Classe core
 # -------------------------
@@ -100,6 +144,7 @@ class WeddingApp:
         self.tag_catalog_csv = os.path.join(self.data_dir, tag_catalog_csv)
         self._universe: Optional[pd.DataFrame] = None
         self._tags: Optional[pd.DataFrame] = None
+        self._company_idx: Optional[Dict[str, int]] = None
         self.random = random.Random(2025)
 
     # ---------- Loaders ----------
@@ -127,6 +172,7 @@ class WeddingApp:
     def refresh_from_disk(self) -> None:
         self._universe = None
         self._tags = None
+        self._company_idx = None
 
     # ---------- Filtering ----------
     def filter_universe_by_tag_keys(self, selected: Set[str]) -> pd.DataFrame:
@@ -148,17 +194,106 @@ class WeddingApp:
         return s
 
     # ---------- Gift code ----------
+    # Formato v1: PREFISSO-<base32>, dove il base32 (senza padding) codifica
+    #   [versione][varint n][n x (varint indice riga universe, varint centesimi)][varint suffisso][CRC-16/XMODEM big-endian]
+    # Il carrello si decodifica dal solo codice + data/universe.csv, senza leggere donations.csv.
+    # Gli indici seguono l'ordine di data/universe.csv: se l'universo cambia ordine, va aumentata la versione.
+    def _company_index(self) -> Dict[str, int]:
+        if self._company_idx is None:
+            idx: Dict[str, int] = {}
+            for i, name in enumerate(self.load_universe()["Company"].astype(str)):
+                idx.setdefault(name, i)
+            self._company_idx = idx
+        return self._company_idx
+
+    def _issued_payloads(self) -> Set[str]:
+        # payload già emessi: quelli nel ledger (letto una volta per processo) + quelli emessi da allora.
+        # Si confronta il solo payload, così lo stesso carrello in IT e EN non coincide.
+        with _ISSUED_LOCK:
+            issued = _ISSUED_PAYLOADS.get(self.donations_csv)
+            if issued is None:
+                issued = set()
+                try:
+                    if os.path.exists(self.donations_csv):
+                        codes = pd.read_csv(self.donations_csv, usecols=["code"])["code"]
+                        issued.update(str(c).partition("-")[2] for c in codes.dropna())
+                except Exception:
+                    pass
+                _ISSUED_PAYLOADS[self.donations_csv] = issued
+            return issued
+
+    def _encode_basket(self, selections: List[Tuple[str, float]]) -> bytes:
+        idx = self._company_index()
+        body = bytearray()
+        items = [(n, a) for n, a in selections if a and float(a) > 0]
+        if len(items) > GIFT_CODE_MAX_PICKS:
+            raise ValueError(f"Too many picks for a gift code: {len(items)} > {GIFT_CODE_MAX_PICKS}")
+        _varint_put(body, len(items))
+        for name, amount in items:
+            if name not in idx:
+                raise ValueError(f"Company not in universe: {name}")
+            if float(amount) > GIFT_AMOUNT_MAX:
+                raise ValueError(f"Amount too large for a gift code: {amount} > {GIFT_AMOUNT_MAX}")
+            _varint_put(body, idx[name])
+            _varint_put(body, int(round(float(amount) * 100)))
+        return bytes(body)
+
     def generate_gift_code(self, selections: List[Tuple[str, float]], lang: str = "it") -> str:
-        total_val = sum(float(a) for _, a in selections if a and float(a) > 0)
-        total = int(round(total_val)) if total_val > 0 else 0
-        seed = f"{json.dumps(selections, sort_keys=True)}|{int(time.time())}"
-        h = hashlib.sha1(seed.encode()).hexdigest()[:6].upper()
-        brands = [re.sub(r'[^A-Za-z0-9]+', '', (n or "")).upper()
-                  for n, a in selections if a and float(a) > 0]
-        brands = [b for b in brands if b] or ["LOVE"]
-        brands = brands[:2]
+        return self.generate_gift_codes([selections], lang)[0]
+
+    def generate_gift_codes(self, baskets: List[List[Tuple[str, float]]], lang: str = "it") -> List[str]:
         prefix = "REGALO" if lang == "it" else "GIFT"
-        return f"#{prefix}-{total}-{'-'.join(brands)}-{h}"
+        issued = self._issued_payloads()
+        out = []
+        with _ISSUED_LOCK:
+            next_suffix = _NEXT_SUFFIX.setdefault(self.donations_csv, {})
+            for selections in baskets:
+                body = bytes([GIFT_CODE_VERSION]) + self._encode_basket(selections)
+                suffix = next_suffix.get(body, 0)
+                while True:
+                    raw = bytearray(body)
+                    _varint_put(raw, suffix)
+                    raw += binascii.crc_hqx(bytes(raw), 0).to_bytes(2, "big")
+                    b32 = base64.b32encode(bytes(raw)).decode("ascii").rstrip("=")
+                    if b32 not in issued:
+                        break
+                    suffix += 1
+                code = f"{prefix}-{b32}"
+                if len(code) > GIFT_CODE_MAX_LEN:
+                    raise ValueError(f"Gift code too long ({len(code)} > {GIFT_CODE_MAX_LEN} chars)")
+                issued.add(b32)
+                next_suffix[body] = suffix + 1
+                out.append(code)
+        return out
+
+    def decode_gift_code(self, code: str) -> List[Tuple[str, float]]:
+        s = re.sub(r"\s+", "", code or "").lstrip("#").upper()
+        b32 = s.partition("-")[2] if "-" in s else s
+        b32 = b32.replace("-", "")
+        try:
+            raw = base64.b32decode(b32 + "=" * (-len(b32) % 8))
+        except Exception:
+            raise ValueError(f"Invalid gift code: {code}")
+        if base64.b32encode(raw).decode("ascii").rstrip("=") != b32:
+            raise ValueError(f"Invalid gift code: {code}")
+        if len(raw) < 4 or binascii.crc_hqx(raw[:-2], 0) != int.from_bytes(raw[-2:], "big"):
+            raise ValueError(f"Invalid gift code (checksum): {code}")
+        if raw[0] != GIFT_CODE_VERSION:
+            raise ValueError(f"Unsupported gift code version {raw[0]}: {code}")
+        names = self.load_universe()["Company"].astype(str).tolist()
+        pos = 1
+        n, pos = _varint_get(raw, pos)
+        selections = []
+        for _ in range(n):
+            i, pos = _varint_get(raw, pos)
+            cents, pos = _varint_get(raw, pos)
+            if i >= len(names):
+                raise ValueError(f"Invalid gift code (index {i}): {code}")
+            selections.append((names[i], cents / 100))
+        _, pos = _varint_get(raw, pos)  # suffisso di unicità
+        if pos != len(raw) - 2:
+            raise ValueError(f"Invalid gift code (length): {code}")
+        return selections
 
     # ---------- Persistence ----------
     def save_donation(self, guest_id: str, lang: str, selections: List[Tuple[str, float]], code: str) -> None:
@@ -197,6 +332,15 @@ class WeddingApp:
             for r in rows:
                 writer.writerow(r)
 
+    # ---------- Diagnostics ----------
+    def data_sizes(self) -> Dict[str, int]:
+        # usato dai tag del profiler: non forza il caricamento dei dati
+        return {
+            "universe_rows": len(self._universe) if self._universe is not None else 0,
+            "tag_rows": len(self._tags) if self._tags is not None else 0,
+            "donations_bytes": os.path.getsize(self.donations_csv) if os.path.exists(self.donations_csv) else 0,
+        }
+
     # ---------- Stats ----------
     def load_stats(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         try:
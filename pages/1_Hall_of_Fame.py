@@ -18,6 +18,7 @@ if str(ROOT) not in sys.path:
 
 try:
     from c_wedding_app import WeddingApp, I18N
+    from c_profiler import PROFILER
 except Exception as e:
     st.set_page_config(page_title="Hall of Fame • Wedding App", page_icon="🏆", layout="centered")
     st.error(f"Impossibile importare c_wedding_app.py: {e}")
@@ -25,6 +26,9 @@ except Exception as e:
 
 st.set_page_config(page_title="Hall of Fame • Wedding App", page_icon="🏆", layout="centered")
 
+# Profiling opt-in (vedi c_profiler.py)
+_capture = PROFILER.start("hall_of_fame") if PROFILER.is_requested(st.query_params) else None
+
 # Lingua condivisa con l'app principale
 if "lang" not in st.session_state:
     st.session_state.lang = "it"
@@ -86,3 +90,5 @@ else:
 
 st.page_link("app.py", label="⬅️ Torna all’app" if st.session_state.lang == "it" else "⬅️ Back to app")
 st.caption("© 2025 • Symbolic gifts only 💖")
+
+PROFILER.finish_rerun(_capture, "hof", st.session_state, app.data_sizes())
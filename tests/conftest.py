@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# stessi import dei moduli locali usati da pages/ (repo root in sys.path)
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,71 @@
+import base64
+import binascii
+from pathlib import Path
+
+import pytest
+
+import c_wedding_app
+from c_wedding_app import WeddingApp, GIFT_CODE_MAX_PICKS, GIFT_CODE_MAX_LEN, GIFT_AMOUNT_MAX
+
+ROOT = Path(__file__).resolve().parents[1]
+BASKET = [("MERCADOLIBRE INC", 150.0), ("FERROVIAL SE", 25.5)]
+
+
+@pytest.fixture
+def app(tmp_path):
+    return WeddingApp(data_dir=str(ROOT), donations_csv=str(tmp_path / "donations.csv"))
+
+
+def test_round_trip(app):
+    code = app.generate_gift_code(BASKET, "it")
+    assert code.startswith("REGALO-")
+    assert app.decode_gift_code(code) == BASKET
+    assert app.decode_gift_code("#" + code.lower()) == BASKET
+
+
+def test_flipped_character_raises(app):
+    code = app.generate_gift_code(BASKET)
+    for i in range(len("REGALO-"), len(code)):
+        flipped = "B" if code[i] == "A" else "A"
+        with pytest.raises(ValueError):
+            app.decode_gift_code(code[:i] + flipped + code[i + 1:])
+
+
+def test_unknown_version_raises(app):
+    raw = bytes([99, 0, 0])
+    raw += binascii.crc_hqx(raw, 0).to_bytes(2, "big")
+    b32 = base64.b32encode(raw).decode("ascii").rstrip("=")
+    with pytest.raises(ValueError, match="version"):
+        app.decode_gift_code(f"REGALO-{b32}")
+
+
+def test_same_basket_gets_unique_codes(app):
+    codes = app.generate_gift_codes([BASKET] * 200) + [app.generate_gift_code(BASKET, "en")]
+    payloads = {c.partition("-")[2] for c in codes}
+    assert len(payloads) == len(codes)
+    assert all(app.decode_gift_code(c) == BASKET for c in codes)
+
+
+def test_ledger_codes_are_not_reissued(app, tmp_path):
+    code = app.generate_gift_code(BASKET)
+    app.save_donation("g", "it", BASKET, code)
+    # riavvio del processo: i codici del ledger vengono riletti
+    c_wedding_app._ISSUED_PAYLOADS.clear()
+    c_wedding_app._NEXT_SUFFIX.clear()
+    again = WeddingApp(data_dir=str(ROOT), donations_csv=app.donations_csv)
+    assert again.generate_gift_code(BASKET) != code
+    # altro ledger: nessuna interferenza
+    other = WeddingApp(data_dir=str(ROOT), donations_csv=str(tmp_path / "other.csv"))
+    assert other.generate_gift_code(BASKET) == code
+
+
+def test_length_limit(app):
+    names = app.load_universe()["Company"].drop_duplicates().tolist()
+    # caso peggiore: indici alti e importi al massimo
+    worst = [(n, GIFT_AMOUNT_MAX) for n in names[-GIFT_CODE_MAX_PICKS:]]
+    codes = app.generate_gift_codes([worst] * 300)
+    assert max(len(c) for c in codes) <= GIFT_CODE_MAX_LEN
+    with pytest.raises(ValueError):
+        app.generate_gift_code([(names[0], GIFT_AMOUNT_MAX + 1)])
+    with pytest.raises(ValueError):
+        app.generate_gift_code([(n, 5.0) for n in names[:GIFT_CODE_MAX_PICKS + 1]])
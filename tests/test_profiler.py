@@ -0,0 +1,71 @@
+import sys
+import time
+import threading
+
+from c_profiler import RerunProfiler, PROCESS_WIDE_PROFILER
+
+
+def test_is_requested_token():
+    p = RerunProfiler(token="secret")
+    assert p.is_requested({"profile": "secret"})
+    assert p.is_requested({"profile": ["secret"]})
+    assert not p.is_requested({"profile": "wrong"})
+    assert not p.is_requested({"profile": "café"})
+    assert not p.is_requested({})
+    assert not RerunProfiler().is_requested({"profile": ""})
+
+
+def test_start_within_min_interval_returns_none(tmp_path):
+    p = RerunProfiler(out_dir=str(tmp_path), min_interval=30)
+    capture = p.start("app")
+    assert capture is not None
+    assert p.finish(capture, {"step": 0}) is not None
+    assert p.start("app") is None
+
+
+def test_interrupted_rerun_is_written_but_rate_limited(tmp_path):
+    p = RerunProfiler(out_dir=str(tmp_path), min_interval=30)
+    assert p.start("app") is not None
+    # reruns interrotti sullo stesso thread: la cattura aperta viene chiusa, nessuna nuova
+    for _ in range(5):
+        assert p.start("app") is None
+    assert len(list(tmp_path.glob("*.pstats"))) == 1
+
+
+def test_watchdog_stops_profiling(tmp_path):
+    p = RerunProfiler(out_dir=str(tmp_path), min_interval=0, max_seconds=0.05)
+    seen = {}
+
+    def script():
+        # rerun "appeso" oltre max_seconds, poi arriva comunque a finish()
+        capture = p.start("app")
+        time.sleep(0.3)
+        seen["after_wait"] = sys.getprofile()
+        seen["slot_after_wait"] = p._active
+        p.finish(capture)
+        seen["after_finish"] = sys.getprofile()
+
+    t = threading.Thread(target=script)
+    t.start()
+    t.join()
+    assert seen["after_finish"] is None
+    assert sys.getprofile() is None
+    assert p._active is None
+    if PROCESS_WIDE_PROFILER:
+        # sys.monitoring: il watchdog spegne il profiler e libera lo slot
+        assert seen["after_wait"] is None
+        assert seen["slot_after_wait"] is None
+    else:
+        # il profiler resta sul thread dello script: lo slot non viene ceduto
+        assert seen["slot_after_wait"] is not None
+    assert len(list(tmp_path.glob("*.json"))) >= 1
+
+
+def test_watchdog_releases_slot_of_dead_thread(tmp_path):
+    p = RerunProfiler(out_dir=str(tmp_path), min_interval=0, max_seconds=5)
+    t = threading.Thread(target=lambda: p.start("app"))
+    t.start()
+    t.join()
+    time.sleep(0.2)
+    assert p._active is None
+    assert len(list(tmp_path.glob("*.json"))) == 1